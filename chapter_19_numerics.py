@@ -0,0 +1,35 @@
+# Numerics configuration of chapter_19_out_of_core.py.
+#
+# Only the out-of-core script uses it. chapter_19_script.py (and the notebook)
+# still casts the features to float32 in SNIPPET 19, does not pin the number
+# of threads and runs GridSearchCV in a single process. Its LinearSVC
+# (liblinear) always works in float64, so a float32 mode there would only
+# change the scaling.
+#
+# Import this module before NumPy, SciPy or scikit-learn: the BLAS/OpenMP
+# libraries read their number of threads when they are loaded. The
+# environment is inherited by the joblib workers, so each worker uses
+# n_threads_per_worker threads. Every setting can be overridden with an
+# environment variable, which is how chapter_19_numerics_comparison.py runs
+# the same script with different settings.
+
+import os
+
+# dtype of the features from disk to the solver
+features_dtype = os.environ.get('CHAPTER_19_FEATURES_DTYPE', 'float32')
+
+# Number of BLAS/OpenMP threads used by each process
+n_threads_per_worker = int(os.environ.get('CHAPTER_19_THREADS_PER_WORKER', 1))
+
+# Number of processes used for the hyper-parameter search
+n_jobs = int(os.environ.get('CHAPTER_19_N_JOBS', 1))
+
+if features_dtype not in ['float32', 'float64']:
+    raise ValueError('features_dtype must be float32 or float64, got %s' % features_dtype)
+
+for thread_variable in ['OMP_NUM_THREADS',
+                        'OPENBLAS_NUM_THREADS',
+                        'MKL_NUM_THREADS',
+                        'VECLIB_MAXIMUM_THREADS',
+                        'NUMEXPR_NUM_THREADS']:
+    os.environ[thread_variable] = str(n_threads_per_worker)
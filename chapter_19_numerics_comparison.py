@@ -0,0 +1,135 @@
+# Comparison of the float32 and float64 numerics for chapter_19_out_of_core.py.
+#
+# Run chapter_19_script.py first (up to SNIPPET 18) so that
+# prepared_features.csv and prepared_targets.csv exist. This script runs
+# chapter_19_out_of_core.py once per dtype as a warm-up, then n_repeats more
+# times alternating the dtypes, each time in a new process configured through
+# chapter_19_numerics.py. The report compares the CV metrics of each dtype
+# with the float64 reference and the fit times saved by each run in
+# timing.csv, which leave out the start-up, loading and saving of the script.
+#
+# Only the out-of-core path is compared: the float64 reference is the SGD
+# solver of chapter_19_out_of_core.py, not the LinearSVC of
+# chapter_19_script.py.
+
+# --------------------------------------------------------------------------
+# SNIPPET 1
+
+# Numerics configuration used for every run, apart from the features dtype
+from chapter_19_numerics import n_threads_per_worker, n_jobs
+
+# Run the training script
+import os
+import subprocess
+import sys
+
+# Store and organize output files
+from pathlib import Path
+
+# Manipulate data
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------------------------------
+# SNIPPET 2
+
+# The first dtype is the reference
+features_dtypes = ['float64', 'float32']
+
+# Number of timed runs of each dtype, after the warm-up run
+n_repeats = 5
+
+# Maximum absolute difference allowed between the CV means of the metrics.
+# With about 330 participants per class, one participant predicted
+# differently changes the mean sensitivity or specificity by about 0.003, so
+# 0.02 allows a handful of participants per class to change.
+tolerance = 0.02
+
+# --------------------------------------------------------------------------
+# SNIPPET 3
+
+results_dir = Path('./results')
+
+training_script = Path(__file__).resolve().parent / 'chapter_19_out_of_core.py'
+
+experiment_name = 'linear_SVM_numerics_example'
+experiment_dir = results_dir / experiment_name
+experiment_dir.mkdir(exist_ok=True)
+
+
+# --------------------------------------------------------------------------
+# SNIPPET 4
+
+def run_training(features_dtype):
+    """Run the training script with features_dtype in a new process and return its timing.csv."""
+    env = dict(os.environ,
+               CHAPTER_19_FEATURES_DTYPE=features_dtype,
+               CHAPTER_19_THREADS_PER_WORKER=str(n_threads_per_worker),
+               CHAPTER_19_N_JOBS=str(n_jobs))
+
+    subprocess.run([sys.executable, str(training_script)], env=env, stdout=subprocess.DEVNULL, check=True)
+    return pd.read_csv(results_dir / ('linear_SVM_out_of_core_%s' % features_dtype) / 'timing.csv',
+                       index_col='CV iteration')
+
+
+# --------------------------------------------------------------------------
+# SNIPPET 5
+
+# The warm-up run also builds the memory-mapped features of each dtype.
+for features_dtype in features_dtypes:
+    print('Warm-up: %s' % features_dtype)
+    run_training(features_dtype)
+
+fit_time = {features_dtype: np.zeros(n_repeats) for features_dtype in features_dtypes}
+samples_per_second = {features_dtype: np.zeros(n_repeats) for features_dtype in features_dtypes}
+for i_repeat in range(n_repeats):
+    # Alternate the order of the dtypes so that none of them always runs first
+    for features_dtype in features_dtypes[::(-1) ** i_repeat]:
+        print('Repeat %d: %s' % (i_repeat + 1, features_dtype))
+        timing_df = run_training(features_dtype)
+        fit_time[features_dtype][i_repeat] = timing_df['fit_time'].sum()
+        samples_per_second[features_dtype][i_repeat] = (timing_df['n_samples_fitted'].sum() /
+                                                        timing_df['fit_time'].sum())
+
+# --------------------------------------------------------------------------
+# SNIPPET 6
+
+metrics_df = {}
+predictions_df = {}
+for features_dtype in features_dtypes:
+    dtype_dir = results_dir / ('linear_SVM_out_of_core_%s' % features_dtype)
+    metrics_df[features_dtype] = pd.read_csv(dtype_dir / 'metrics.csv', index_col='CV iteration')
+    predictions_df[features_dtype] = pd.read_csv(dtype_dir / 'predictions.csv', index_col='ID')
+
+reference_dtype = features_dtypes[0]
+reference_metrics_df = metrics_df[reference_dtype]
+reference_predictions = predictions_df[reference_dtype]['predictions']
+reference_time = np.median(fit_time[reference_dtype])
+
+report = []
+for features_dtype in features_dtypes:
+    mean_abs_diff = (metrics_df[features_dtype].mean() - reference_metrics_df.mean()).abs()
+    fold_abs_diff = (metrics_df[features_dtype] - reference_metrics_df).abs()
+    median_time = np.median(fit_time[features_dtype])
+
+    report.append({'dtype': features_dtype,
+                   'n_threads_per_worker': n_threads_per_worker,
+                   'n_jobs': n_jobs,
+                   'bac': metrics_df[features_dtype]['bac'].mean(),
+                   'sens': metrics_df[features_dtype]['sens'].mean(),
+                   'spec': metrics_df[features_dtype]['spec'].mean(),
+                   'max_mean_abs_diff': mean_abs_diff.max(),
+                   'within_tolerance': mean_abs_diff.max() <= tolerance,
+                   'max_fold_abs_diff': fold_abs_diff.values.max(),
+                   'predictions_agreement': np.mean(predictions_df[features_dtype]['predictions'] ==
+                                                    reference_predictions),
+                   'median_fit_time': median_time,
+                   'min_fit_time': fit_time[features_dtype].min(),
+                   'samples_per_second': np.median(samples_per_second[features_dtype]),
+                   'speedup': reference_time / median_time})
+
+report_df = pd.DataFrame(report).set_index('dtype')
+print('Numerics comparison (reference = %s, tolerance = %.3f)' % (reference_dtype, tolerance))
+print(report_df.T)
+
+report_df.to_csv(experiment_dir / 'numerics_comparison.csv', index=True)
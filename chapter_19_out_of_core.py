@@ -0,0 +1,320 @@
+# Out-of-core version of the linear SVM experiment from chapter_19_script.py.
+#
+# Run chapter_19_script.py first (up to SNIPPET 18) so that
+# prepared_features.csv and prepared_targets.csv exist. Here the features are
+# never loaded into memory at once: they are copied into a memory-mapped file
+# and read back in row blocks, the StandardScaler statistics are computed in a
+# single streaming pass and the linear SVM is trained with a hinge-loss SGD
+# solver. The cross-validation folds are the same as in the main script.
+#
+# The features dtype, the number of BLAS/OpenMP threads and the number of
+# processes used for the hyper-parameter search are set in
+# chapter_19_numerics.py.
+
+# --------------------------------------------------------------------------
+# SNIPPET 1
+
+# Numerics configuration, imported before NumPy to pin the number of threads
+from chapter_19_numerics import features_dtype, n_jobs
+
+# Store and organize output files
+import os
+from pathlib import Path
+
+# Measure time
+import time
+
+# Manipulate data
+import numpy as np
+import pandas as pd
+
+# Save models and run the hyper-parameter search in parallel
+import joblib
+from joblib import Parallel, delayed
+
+# Machine learning
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import balanced_accuracy_score, confusion_matrix
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import StratifiedKFold
+
+# Ignore WARNING
+import warnings
+
+warnings.filterwarnings('ignore')
+
+# --------------------------------------------------------------------------
+# SNIPPET 2
+
+random_seed = 1
+np.random.seed(random_seed)
+
+# Memory budget of one block of rows read from disk, in bytes. The number of
+# rows in a block is set from it once the number of features is known.
+block_bytes = 256 * 1024 ** 2
+
+# Number of passes of the SGD solver over the training set
+n_epochs = 10
+
+# --------------------------------------------------------------------------
+# SNIPPET 3
+
+results_dir = Path('./results')
+
+prepared_dir = results_dir / 'linear_SVM_example'
+
+experiment_name = 'linear_SVM_out_of_core_%s' % features_dtype
+experiment_dir = results_dir / experiment_name
+experiment_dir.mkdir(exist_ok=True)
+
+# --------------------------------------------------------------------------
+# SNIPPET 4
+
+healthy_str = 'hc'
+patient_str = 'sz'
+
+# The targets are a single column, so they can be kept in memory.
+targets_df = pd.read_csv(prepared_dir / 'prepared_targets.csv', index_col='ID')['Diagnosis']
+targets_df = targets_df.map({healthy_str: 0, patient_str: 1})
+targets = targets_df.values.astype('int')
+
+# --------------------------------------------------------------------------
+# SNIPPET 5
+
+# Copy the prepared features into a memory-mapped .npy file, one block of
+# rows at a time and stored with features_dtype. The copy is reused only if it
+# is newer than the CSV and has the expected shape and dtype; otherwise it is
+# rebuilt.
+features_file = experiment_dir / 'prepared_features.npy'
+features_csv = prepared_dir / 'prepared_features.csv'
+
+features_names = pd.read_csv(features_csv, index_col='ID', nrows=0).columns
+features_shape = (len(targets), len(features_names))
+
+# Rows per block. The CSV chunks are parsed as float64, so the budget is
+# counted with 8 bytes per value whatever the dtype stored on disk.
+block_size = max(1, block_bytes // (len(features_names) * np.dtype('float64').itemsize))
+
+features = None
+if features_file.exists() and features_file.stat().st_mtime >= features_csv.stat().st_mtime:
+    features = np.load(str(features_file), mmap_mode='r')
+    if features.shape != features_shape or features.dtype != features_dtype:
+        features = None
+
+if features is None:
+    # Write to a temporary file and only move it into place once the copy is
+    # complete, so that a failed copy never leaves a partial file behind.
+    features_tmp_file = experiment_dir / 'prepared_features.tmp.npy'
+    features_mmap = np.lib.format.open_memmap(str(features_tmp_file),
+                                              mode='w+',
+                                              dtype=features_dtype,
+                                              shape=features_shape)
+
+    try:
+        start = 0
+        for features_block_df in pd.read_csv(features_csv, index_col='ID', chunksize=block_size):
+            stop = start + features_block_df.shape[0]
+
+            if not features_block_df.index.equals(targets_df.index[start:stop]):
+                raise ValueError('prepared_features.csv and prepared_targets.csv are not aligned')
+
+            features_mmap[start:stop] = features_block_df.values.astype(features_dtype)
+            start = stop
+
+        if start != features_shape[0]:
+            raise ValueError('prepared_features.csv and prepared_targets.csv have different numbers of rows')
+    except BaseException:
+        del features_mmap
+        features_tmp_file.unlink()
+        raise
+
+    features_mmap.flush()
+    del features_mmap
+    os.replace(str(features_tmp_file), str(features_file))
+
+    features = np.load(str(features_file), mmap_mode='r')
+
+print('Number of features = %d' % features.shape[1])
+print('Number of participants = %d' % features.shape[0])
+
+
+# --------------------------------------------------------------------------
+# SNIPPET 6
+
+def iter_blocks(indexes):
+    """Yield the rows of the memory-mapped features selected by indexes, block_size rows at a time."""
+    for start in range(0, len(indexes), block_size):
+        block_idx = indexes[start:start + block_size]
+        # Reading the rows in increasing order keeps the disk access sequential.
+        order = np.argsort(block_idx)
+        yield block_idx[order], features[block_idx[order]]
+
+
+# StandardScaler keeps the dtype of the features. SGDClassifier keeps float32
+# only from scikit-learn 1.3; older versions convert each block to float64
+# before the solver runs, so with them float32 only applies to the file on
+# disk and to the scaling.
+def fit_scaler(indexes):
+    """Compute the StandardScaler statistics in one pass over the blocks."""
+    scaler = StandardScaler()
+    for _, features_block in iter_blocks(indexes):
+        scaler.partial_fit(features_block)
+    return scaler
+
+
+def fit_classifier(scaler, indexes, alpha):
+    """Train a hinge-loss (linear SVM) SGD classifier block by block."""
+    clf = SGDClassifier(loss='hinge', alpha=alpha, random_state=random_seed)
+    rng = np.random.RandomState(random_seed)
+
+    for _ in range(n_epochs):
+        for block_idx, features_block in iter_blocks(rng.permutation(indexes)):
+            clf.partial_fit(scaler.transform(features_block), targets[block_idx], classes=np.array([0, 1]))
+    return clf
+
+
+def predict(clf, scaler, indexes):
+    """Predict the targets of the selected rows block by block."""
+    predicted = np.zeros(len(indexes), dtype='int')
+    order = np.argsort(indexes)
+    sorted_idx = indexes[order]
+    for block_idx, features_block in iter_blocks(sorted_idx):
+        predicted[order[np.searchsorted(sorted_idx, block_idx)]] = clf.predict(scaler.transform(features_block))
+    return predicted
+
+
+def fit_and_score(scaler, train_indexes, test_indexes, C):
+    """Train with C on train_indexes and return the balanced accuracy on test_indexes and the fit time."""
+    start_time = time.perf_counter()
+    clf = fit_classifier(scaler, train_indexes, alpha=1. / (C * len(train_indexes)))
+    fit_time = time.perf_counter() - start_time
+    return balanced_accuracy_score(targets[test_indexes], predict(clf, scaler, test_indexes)), fit_time
+
+
+# --------------------------------------------------------------------------
+# SNIPPET 7
+
+n_folds = 10
+skf = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_seed)
+
+predictions_df = pd.DataFrame(targets_df)
+predictions_df['predictions'] = np.nan
+
+bac_cv = np.zeros((n_folds, 1))
+sens_cv = np.zeros((n_folds, 1))
+spec_cv = np.zeros((n_folds, 1))
+coef_cv = np.zeros((n_folds, len(features_names)))
+
+# Time spent fitting the classifiers, number of fits and number of samples
+# seen by the solver (fits x epochs x training rows) in each CV iteration
+fit_time_cv = np.zeros((n_folds, 1))
+n_fits_cv = np.zeros((n_folds, 1))
+n_samples_fitted_cv = np.zeros((n_folds, 1))
+
+models_dir = experiment_dir / 'models'
+models_dir.mkdir(exist_ok=True)
+
+# Same search space as the LinearSVC. The regularization of the SGD solver is
+# given by alpha = 1 / (C * n_samples).
+param_grid = {'C': [2 ** -6, 2 ** -5, 2 ** -4, 2 ** -3, 2 ** -2, 2 ** -1, 2 ** 0, 2 ** 1]}
+
+# --------------------------------------------------------------------------
+# SNIPPET 8
+
+# StratifiedKFold only uses the number of rows of the features, so the split
+# is the same as in chapter_19_script.py and nothing is loaded from disk.
+for i_fold, (train_idx, test_idx) in enumerate(skf.split(features, targets)):
+    targets_train, targets_test = targets[train_idx], targets[test_idx]
+
+    print('CV iteration: %d' % (i_fold + 1))
+    print('Training set size: %d' % len(targets_train))
+    print('Test set size: %d' % len(targets_test))
+
+    scaler = fit_scaler(train_idx)
+
+    # Gridsearch, with the fits spread over n_jobs processes
+    internal_cv = StratifiedKFold(n_splits=10)
+    internal_splits = list(internal_cv.split(train_idx, targets_train))
+    internal_results = Parallel(n_jobs=n_jobs)(
+        delayed(fit_and_score)(scaler, train_idx[internal_train], train_idx[internal_test], C)
+        for internal_train, internal_test in internal_splits
+        for C in param_grid['C'])
+    internal_bac, internal_fit_time = zip(*internal_results)
+    internal_bac = np.array(internal_bac).reshape(internal_cv.n_splits, len(param_grid['C'])).T
+
+    means = internal_bac.mean(axis=1)
+    stds = internal_bac.std(axis=1)
+    best_C = param_grid['C'][np.argmax(means)]
+
+    print('Best: %f using %s' % (means.max(), {'C': best_C}))
+    for mean, stdev, C in zip(means, stds, param_grid['C']):
+        print('%f (%f) with: %r' % (mean, stdev, {'C': C}))
+
+    start_time = time.perf_counter()
+    best_clf = fit_classifier(scaler, train_idx, alpha=1. / (best_C * len(train_idx)))
+    best_fit_time = time.perf_counter() - start_time
+
+    fit_time_cv[i_fold, :] = np.sum(internal_fit_time) + best_fit_time
+    n_fits_cv[i_fold, :] = len(internal_results) + 1
+    n_internal_rows = sum(len(internal_train) for internal_train, _ in internal_splits)
+    n_samples_fitted_cv[i_fold, :] = n_epochs * (len(param_grid['C']) * n_internal_rows + len(train_idx))
+
+    joblib.dump(best_clf, models_dir / ('classifier_%d.joblib' % i_fold))
+    joblib.dump(scaler, models_dir / ('scaler_%d.joblib' % i_fold))
+
+    coef_cv[i_fold, :] = np.abs(best_clf.coef_)
+
+    target_test_predicted = predict(best_clf, scaler, test_idx)
+
+    predictions_df.iloc[test_idx, predictions_df.columns.get_loc('predictions')] = target_test_predicted
+
+    print('Confusion matrix')
+    cm = confusion_matrix(targets_test, target_test_predicted)
+    print(cm)
+
+    tn, fp, fn, tp = cm.ravel()
+
+    bac_test = balanced_accuracy_score(targets_test, target_test_predicted)
+    sens_test = tp / (tp + fn)
+    spec_test = tn / (tn + fp)
+
+    print('Balanced accuracy: %.3f ' % bac_test)
+    print('Sensitivity: %.3f ' % sens_test)
+    print('Specificity: %.3f ' % spec_test)
+
+    bac_cv[i_fold, :] = bac_test
+    sens_cv[i_fold, :] = sens_test
+    spec_cv[i_fold, :] = spec_test
+
+# --------------------------------------------------------------------------
+# SNIPPET 9
+
+print('CV results')
+print('Bac: Mean(SD) = %.3f(%.3f)' % (bac_cv.mean(), bac_cv.std()))
+print('Sens: Mean(SD) = %.3f(%.3f)' % (sens_cv.mean(), sens_cv.std()))
+print('Spec: Mean(SD) = %.3f(%.3f)' % (spec_cv.mean(), spec_cv.std()))
+
+# --------------------------------------------------------------------------
+# SNIPPET 10
+
+# Saving feature importance
+mean_coef = np.mean(coef_cv, axis=0).reshape(1, -1)
+
+coef_df = pd.DataFrame(data=mean_coef, columns=features_names.values)
+coef_df.to_csv(experiment_dir / 'feature_importance.csv', index=False)
+
+# Saving predictions
+predictions_df.to_csv(experiment_dir / 'predictions.csv', index=True)
+
+# Saving metrics
+metrics = np.concatenate((bac_cv, sens_cv, spec_cv), axis=1)
+metrics_df = pd.DataFrame(data=metrics, columns=['bac', 'sens', 'spec'])
+metrics_df.index.name = 'CV iteration'
+metrics_df.to_csv(experiment_dir / 'metrics.csv', index=True)
+
+# Saving fit times. With n_jobs > 1 the fit times of the parallel fits are
+# added up, so samples_per_second is the throughput of one worker.
+timing = np.concatenate((fit_time_cv, n_fits_cv, n_samples_fitted_cv, n_samples_fitted_cv / fit_time_cv), axis=1)
+timing_df = pd.DataFrame(data=timing, columns=['fit_time', 'n_fits', 'n_samples_fitted', 'samples_per_second'])
+timing_df.index.name = 'CV iteration'
+timing_df.to_csv(experiment_dir / 'timing.csv', index=True)